@@ -4,9 +4,169 @@
 """
 import json
 import os
+import re
+import struct
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-import cv2
+import av
 import numpy as np
+import pandas as pd
+
+# 視頻文件名格式: episode_000000.mp4
+EP_RE = re.compile(r"episode_(\d+)$")
+
+def _mp4_boxes(buf, start, end):
+    """走訪buf[start:end]裡的MP4 box，產出 (type, body_start, body_end)"""
+    pos = start
+    while pos + 8 <= end:
+        size, btype = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            size, = struct.unpack_from(">Q", buf, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield btype, pos + header, pos + size
+        pos += size
+
+def parse_mp4_moov(path):
+    """直接解析MP4的moov atom讀取元數據，完全不經過demuxer (每個文件只讀幾KB)
+
+    回傳 (frame_count, fps, width, height)，非MP4或結構異常時回傳None
+    """
+    try:
+        with open(path, 'rb') as f:
+            # 逐box跳到moov (通常在文件開頭或結尾)
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                size, btype = struct.unpack(">I4s", header)
+                if size == 1:
+                    size, = struct.unpack(">Q", f.read(8))
+                    body = size - 16
+                elif size == 0:
+                    return None
+                else:
+                    body = size - 8
+                if body < 0:
+                    return None
+                if btype == b"moov":
+                    buf = f.read(body)
+                    break
+                f.seek(body, 1)
+    except OSError:
+        return None
+
+    try:
+        for btype, b0, b1 in _mp4_boxes(buf, 0, len(buf)):
+            if btype != b"trak":
+                continue
+            width = height = 0
+            timescale = duration = sample_count = 0
+            is_video = False
+            for t, t0, t1 in _mp4_boxes(buf, b0, b1):
+                if t == b"tkhd":
+                    # width/height是16.16定點數，位置依version而定
+                    off = t0 + (76 if buf[t0] == 0 else 88)
+                    w_fp, h_fp = struct.unpack_from(">II", buf, off)
+                    width, height = w_fp >> 16, h_fp >> 16
+                elif t == b"mdia":
+                    for m, m0, m1 in _mp4_boxes(buf, t0, t1):
+                        if m == b"mdhd":
+                            if buf[m0] == 0:
+                                timescale, duration = struct.unpack_from(">II", buf, m0 + 12)
+                            else:
+                                timescale, = struct.unpack_from(">I", buf, m0 + 20)
+                                duration, = struct.unpack_from(">Q", buf, m0 + 24)
+                        elif m == b"hdlr":
+                            is_video = buf[m0 + 8:m0 + 12] == b"vide"
+                        elif m == b"minf":
+                            for s, s0, s1 in _mp4_boxes(buf, m0, m1):
+                                if s == b"stbl":
+                                    for x, x0, x1 in _mp4_boxes(buf, s0, s1):
+                                        if x == b"stsz":
+                                            sample_count, = struct.unpack_from(">I", buf, x0 + 8)
+            if is_video and sample_count > 0 and timescale > 0 and duration > 0:
+                fps = sample_count / (duration / timescale)
+                return sample_count, fps, width, height
+    except (struct.error, IndexError):
+        pass
+    return None
+
+def probe_video(path):
+    """讀取視頻的容器元數據，回傳 (frame_count, fps, width, height)，失敗時回傳None
+
+    優先走moov atom直接解析 (只讀幾KB)；非標準容器退回PyAV，再退回ffprobe
+    """
+    probed = parse_mp4_moov(path)
+    if probed is not None:
+        return probed
+
+    try:
+        with av.open(str(path)) as container:
+            stream = container.streams.video[0]
+            frame_count = stream.frames
+            fps = float(stream.average_rate) if stream.average_rate else 0.0
+            width = stream.codec_context.width
+            height = stream.codec_context.height
+        if frame_count > 0:
+            return frame_count, fps, width, height
+    except (av.error.FFmpegError, IndexError):
+        pass
+
+    # 容器損壞或沒有nb_frames資訊時用ffprobe數packet
+    return _ffprobe_video(path)
+
+def _ffprobe_video(path):
+    """用ffprobe子進程讀取視頻元數據，回傳 (frame_count, fps, width, height) 或 None"""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=nb_frames,r_frame_rate,width,height",
+        "-of", "json", str(path),
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+    except (FileNotFoundError, OSError):
+        # 沒裝ffprobe時走原本的警告路徑，不要讓整個分析掛掉
+        return None
+    if result.returncode != 0:
+        return None
+
+    try:
+        stream = json.loads(result.stdout)["streams"][0]
+    except (json.JSONDecodeError, KeyError, IndexError):
+        return None
+
+    # r_frame_rate是有理數字串 (例如 "30000/1001" → 29.97)
+    num, _, den = stream.get("r_frame_rate", "0/1").partition("/")
+    den = den or "1"
+    fps = float(num) / float(den) if float(den) > 0 else 0.0
+
+    nb_frames = stream.get("nb_frames", "N/A")
+    if nb_frames == "N/A":
+        # 部分容器沒有nb_frames，改數packet (仍然不解碼)
+        cmd = [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-count_packets", "-show_entries", "stream=nb_read_packets",
+            "-of", "json", str(path),
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True)
+        except (FileNotFoundError, OSError):
+            return None
+        if result.returncode != 0:
+            return None
+        try:
+            nb_frames = json.loads(result.stdout)["streams"][0]["nb_read_packets"]
+        except (json.JSONDecodeError, KeyError, IndexError):
+            return None
+
+    return int(nb_frames), fps, int(stream.get("width", 0)), int(stream.get("height", 0))
 
 def analyze_dataset(dataset_path):
     """分析數據集中所有episode的統計信息"""
@@ -30,7 +190,7 @@ def analyze_dataset(dataset_path):
     print()
     
     # 分析每個episode
-    episodes_data = []
+    episodes_data = None
     
     # 讀取data目錄下的parquet文件
     data_dir = dataset_path / "data"
@@ -42,60 +202,108 @@ def analyze_dataset(dataset_path):
     video_dir = dataset_path / "videos"
     if video_dir.exists():
         print("📹 分析視頻文件...")
-        
-        # 處理chunk結構
+
+        # 先收集所有待探測的視頻文件
+        tasks = []
         for chunk_dir in sorted(video_dir.glob("chunk-*")):
             if not chunk_dir.is_dir():
                 continue
-            
+
             for cam_dir in sorted(chunk_dir.iterdir()):
                 if cam_dir.is_dir():
                     camera_name = cam_dir.name
-                    print(f"\n  相機: {camera_name}")
-                    
-                    video_files = sorted(cam_dir.glob("*.mp4"))
-                    for video_file in video_files:
+                    for video_file in sorted(cam_dir.glob("*.mp4")):
                         # 從文件名提取episode_index (例如: episode_000000.mp4)
-                        ep_name = video_file.stem
-                        if ep_name.startswith("episode_"):
-                            ep_index = int(ep_name.split("_")[1])
-                        else:
-                            continue
-                        
-                        # 打開視頻文件獲取信息
-                        cap = cv2.VideoCapture(str(video_file))
-                        if not cap.isOpened():
-                            print(f"    ⚠️  無法打開視頻: {video_file}")
-                            continue
-                        
-                        # 獲取視頻屬性
-                        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                        video_fps = cap.get(cv2.CAP_PROP_FPS)
-                        video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                        video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        duration = frame_count / video_fps if video_fps > 0 else 0
-                        
-                        cap.release()
-                        
-                        # 記錄episode數據
-                        episode_info = {
-                            'episode': ep_index,
-                            'camera': camera_name,
-                            'frames': frame_count,
-                            'video_fps': video_fps,
-                            'duration_sec': duration,
-                            'resolution': f"{video_width}x{video_height}",
-                            'file_size_mb': video_file.stat().st_size / (1024 * 1024)
-                        }
-                        episodes_data.append(episode_info)
-                        
-                        # 即時顯示
-                        print(f"    Episode {ep_index:03d}: {frame_count:4d} 幀, "
-                              f"{video_fps:.2f} fps, {duration:.2f}秒, "
-                              f"{video_width}x{video_height}, "
-                              f"{episode_info['file_size_mb']:.2f}MB")
-    
-    if not episodes_data:
+                        m = EP_RE.match(video_file.stem)
+                        if m:
+                            tasks.append((camera_name, int(m.group(1)), video_file))
+
+        # 探測結果快取: 只要(路徑, mtime, 大小)沒變，重跑就不用再探測
+        cache_path = dataset_path / ".probe_cache.json"
+        try:
+            with open(cache_path, 'r') as f:
+                probe_cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            probe_cache = {}
+
+        # SoA累加器: 每個探測槽位一欄，省掉list-of-dicts和之後的逐欄gather
+        n = len(tasks)
+        ep_idx_arr = np.zeros(n, dtype=np.int32)
+        frames_arr = np.zeros(n, dtype=np.int32)
+        fps_arr = np.zeros(n, dtype=np.float64)
+        dur_arr = np.zeros(n, dtype=np.float64)
+        size_arr = np.zeros(n, dtype=np.float64)
+        width_arr = np.zeros(n, dtype=np.int32)
+        height_arr = np.zeros(n, dtype=np.int32)
+        ok_arr = np.zeros(n, dtype=bool)
+
+        def probe_one(slot):
+            """探測單個視頻，把結果寫進槽位slot，成功回傳True"""
+            camera_name, ep_index, video_file = tasks[slot]
+            stat = video_file.stat()
+            key = f"{video_file}|{stat.st_mtime_ns}|{stat.st_size}"
+            cached = probe_cache.get(key)
+            if cached is not None:
+                probed = tuple(cached)
+            else:
+                probed = probe_video(video_file)
+                if probed is None:
+                    return False
+                # dict寫入在GIL下是原子的，多執行緒直接更新即可
+                probe_cache[key] = list(probed)
+
+            frame_count, video_fps, video_width, video_height = probed
+            ep_idx_arr[slot] = ep_index
+            frames_arr[slot] = frame_count
+            fps_arr[slot] = video_fps
+            dur_arr[slot] = frame_count / video_fps if video_fps > 0 else 0
+            size_arr[slot] = stat.st_size / (1024 * 1024)
+            width_arr[slot] = video_width
+            height_arr[slot] = video_height
+            ok_arr[slot] = True
+            return True
+
+        # 探測是I/O + ffprobe啟動，用thread pool重疊多個探測
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {executor.submit(probe_one, slot): slot for slot in range(n)}
+            for future in as_completed(futures):
+                if not future.result():
+                    print(f"    ⚠️  無法打開視頻: {tasks[futures[future]][2]}")
+
+        # 原子寫回快取，下次重跑只需探測新錄的episode
+        tmp_path = cache_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(probe_cache, f)
+        os.replace(tmp_path, cache_path)
+
+        # 按(相機, episode)排序輸出，保持與順序掃描相同的結果
+        # 輸出先累積在list，一次寫出，避免每行一個write系統呼叫
+        cam_names = np.array([t[0] for t in tasks])
+        out = []
+        current_camera = None
+        for slot in np.lexsort((ep_idx_arr, cam_names)):
+            if not ok_arr[slot]:
+                continue
+            if cam_names[slot] != current_camera:
+                current_camera = cam_names[slot]
+                out.append(f"\n  相機: {current_camera}")
+
+            out.append(f"    Episode {ep_idx_arr[slot]:03d}: {frames_arr[slot]:4d} 幀, "
+                       f"{fps_arr[slot]:.2f} fps, {dur_arr[slot]:.2f}秒, "
+                       f"{width_arr[slot]}x{height_arr[slot]}, "
+                       f"{size_arr[slot]:.2f}MB")
+        sys.stdout.write("\n".join(out) + "\n")
+
+        episodes_data = pd.DataFrame({
+            'episode': ep_idx_arr[ok_arr],
+            'camera': cam_names[ok_arr],
+            'frames': frames_arr[ok_arr],
+            'video_fps': fps_arr[ok_arr],
+            'duration_sec': dur_arr[ok_arr],
+            'file_size_mb': size_arr[ok_arr],
+        })
+
+    if episodes_data is None or len(episodes_data) == 0:
         print("\n❌ 沒有找到任何視頻文件")
         return
     
@@ -104,53 +312,49 @@ def analyze_dataset(dataset_path):
     print("📈 統計分析:")
     print("="*80)
     
-    # 按episode分組
-    from collections import defaultdict
-    episodes_by_num = defaultdict(list)
-    for ep_data in episodes_data:
-        episodes_by_num[ep_data['episode']].append(ep_data)
-    
+    # 按episode分組 (一次groupby取代逐episode的Python迴圈)
+    per_episode = episodes_data.groupby('episode').agg(
+        cameras=('camera', 'size'),
+        avg_frames=('frames', 'mean'),
+        avg_fps=('video_fps', 'mean'),
+        avg_duration=('duration_sec', 'mean'),
+        total_size=('file_size_mb', 'sum'),
+    ).sort_index()
+
     # 打印每個episode的匯總信息
     print("\n各Episode詳細信息:")
     print("-" * 80)
     print(f"{'Ep':>3} | {'相機數':>6} | {'平均幀數':>8} | {'平均FPS':>8} | {'平均時長':>8} | {'總大小(MB)':>11}")
     print("-" * 80)
-    
-    all_durations = []
-    all_frame_counts = []
-    all_fps = []
-    
-    for ep_num in sorted(episodes_by_num.keys()):
-        ep_list = episodes_by_num[ep_num]
-        avg_frames = np.mean([ep['frames'] for ep in ep_list])
-        avg_fps = np.mean([ep['video_fps'] for ep in ep_list])
-        avg_duration = np.mean([ep['duration_sec'] for ep in ep_list])
-        total_size = sum([ep['file_size_mb'] for ep in ep_list])
-        
-        all_durations.append(avg_duration)
-        all_frame_counts.append(avg_frames)
-        all_fps.append(avg_fps)
-        
-        print(f"{ep_num:3d} | {len(ep_list):6d} | {avg_frames:8.1f} | {avg_fps:8.2f} | {avg_duration:8.2f}s | {total_size:11.2f}")
-    
+
+    out = [
+        f"{ep_num:3d} | {int(row['cameras']):6d} | {row['avg_frames']:8.1f} | {row['avg_fps']:8.2f} | {row['avg_duration']:8.2f}s | {row['total_size']:11.2f}"
+        for ep_num, row in per_episode.iterrows()
+    ]
+    sys.stdout.write("\n".join(out) + "\n")
+
+    all_durations = per_episode['avg_duration'].to_numpy(dtype=np.float64)
+    all_frame_counts = per_episode['avg_frames'].to_numpy(dtype=np.float64)
+    all_fps = per_episode['avg_fps'].to_numpy(dtype=np.float64)
+
     # 整體統計
     print("-" * 80)
-    print(f"\n🔍 整體統計 (共{len(episodes_by_num)}個episodes):")
+    print(f"\n🔍 整體統計 (共{len(per_episode)}個episodes):")
     print(f"  時長:")
-    print(f"    - 最短: {min(all_durations):.2f}秒 (Episode {all_durations.index(min(all_durations))})")
-    print(f"    - 最長: {max(all_durations):.2f}秒 (Episode {all_durations.index(max(all_durations))})")
+    print(f"    - 最短: {all_durations.min():.2f}秒 (Episode {int(all_durations.argmin())})")
+    print(f"    - 最長: {all_durations.max():.2f}秒 (Episode {int(all_durations.argmax())})")
     print(f"    - 平均: {np.mean(all_durations):.2f}秒")
     print(f"    - 標準差: {np.std(all_durations):.2f}秒")
-    
+
     print(f"\n  幀數:")
-    print(f"    - 最少: {min(all_frame_counts):.0f}幀 (Episode {all_frame_counts.index(min(all_frame_counts))})")
-    print(f"    - 最多: {max(all_frame_counts):.0f}幀 (Episode {all_frame_counts.index(max(all_frame_counts))})")
+    print(f"    - 最少: {all_frame_counts.min():.0f}幀 (Episode {int(all_frame_counts.argmin())})")
+    print(f"    - 最多: {all_frame_counts.max():.0f}幀 (Episode {int(all_frame_counts.argmax())})")
     print(f"    - 平均: {np.mean(all_frame_counts):.0f}幀")
     print(f"    - 標準差: {np.std(all_frame_counts):.2f}幀")
-    
+
     print(f"\n  實際FPS:")
-    print(f"    - 最低: {min(all_fps):.2f} (Episode {all_fps.index(min(all_fps))})")
-    print(f"    - 最高: {max(all_fps):.2f} (Episode {all_fps.index(max(all_fps))})")
+    print(f"    - 最低: {all_fps.min():.2f} (Episode {int(all_fps.argmin())})")
+    print(f"    - 最高: {all_fps.max():.2f} (Episode {int(all_fps.argmax())})")
     print(f"    - 平均: {np.mean(all_fps):.2f}")
     print(f"    - 標準差: {np.std(all_fps):.2f}")
     
@@ -192,7 +396,6 @@ def analyze_dataset(dataset_path):
         print(f"   建議檢查系統資源使用情況")
 
 if __name__ == "__main__":
-    import sys
     
     # 默認路徑
     default_path = Path.home() / ".cache/huggingface/lerobot/thomas0829/bimanual-so101-stacking-blocks-v2"
@@ -6,7 +6,7 @@ import json
 from pathlib import Path
 import pyarrow.parquet as pq
 import numpy as np
-from collections import defaultdict
+import pandas as pd
 
 def analyze_timestamps(dataset_path):
     """分析parquet數據中的timestamps"""
@@ -27,83 +27,66 @@ def analyze_timestamps(dataset_path):
     print(f"找到 {len(parquet_files)} 個parquet文件")
     
     # 讀取所有數據
-    all_episodes = defaultdict(list)
-    total_rows = 0
-    columns = None
-    
-    for pf in sorted(parquet_files):
-        table = pq.read_table(pf)
-        if columns is None:
-            columns = table.column_names
-        
-        # 提取需要的列
-        episode_indices = table['episode_index'].to_pylist()
-        timestamps = table['timestamp'].to_pylist()
-        
-        for ep_idx, ts in zip(episode_indices, timestamps):
-            all_episodes[ep_idx].append(ts)
-            total_rows += 1
-    
+    ep_chunks = []
+    ts_chunks = []
+
+    # 完整欄位清單只從schema讀，不用解碼任何數據
+    parquet_files = sorted(parquet_files)
+    columns = pq.read_schema(parquet_files[0]).names
+
+    for pf in parquet_files:
+        # 只解碼需要的兩列；memory_map讓未壓縮的列直接從page cache讀
+        table = pq.read_table(pf, columns=['episode_index', 'timestamp'], memory_map=True, use_threads=True)
+
+        # 提取需要的列 (保持numpy陣列，不逐行轉Python物件)
+        ep_chunks.append(table['episode_index'].to_numpy(zero_copy_only=False))
+        ts_chunks.append(table['timestamp'].to_numpy(zero_copy_only=False))
+
+    df = pd.DataFrame({
+        'episode_index': np.concatenate(ep_chunks),
+        'timestamp': np.concatenate(ts_chunks),
+    })
+    total_rows = len(df)
+
     print(f"\n總共有 {total_rows} 條數據")
     print(f"Columns: {columns}")
-    
-    # 按episode分組
-    episodes = df.groupby('episode_index')
-    
+
     print(f"\n分析每個episode的實際FPS:")
     print("="*80)
     print(f"{'Ep':>3} | {'幀數':>6} | {'開始時間':>10} | {'結束時間':>10} | {'時長(秒)':>9} | {'實際FPS':>8} | {'目標FPS':>8}")
     print("-"*80)
-    
-    results = []
-    
-    for ep_idx, group in episodes:
-        frame_count = len(group)
-        timestamps = group['timestamp'].values
-        
-        start_time = timestamps[0]
-        end_time = timestamps[-1]
-        duration = end_time - start_time
-        
-        if duration > 0:
-            actual_fps = (frame_count - 1) / duration
-        else:
-            actual_fps = 0
-        
-        # 計算幀間隔
-        if len(timestamps) > 1:
-            intervals = np.diff(timestamps)
-            avg_interval = np.mean(intervals)
-            std_interval = np.std(intervals)
-            min_interval = np.min(intervals)
-            max_interval = np.max(intervals)
-            target_fps = 1 / avg_interval if avg_interval > 0 else 0
-        else:
-            avg_interval = 0
-            std_interval = 0
-            min_interval = 0
-            max_interval = 0
-            target_fps = 0
-        
-        results.append({
-            'episode': ep_idx,
-            'frames': frame_count,
-            'duration': duration,
-            'actual_fps': actual_fps,
-            'target_fps': target_fps,
-            'avg_interval': avg_interval,
-            'std_interval': std_interval,
-            'min_interval': min_interval,
-            'max_interval': max_interval
-        })
-        
-        print(f"{ep_idx:3d} | {frame_count:6d} | {start_time:10.3f} | {end_time:10.3f} | {duration:9.3f} | {actual_fps:8.2f} | {target_fps:8.2f}")
-    
+
+    # 一次groupby算出每個episode的幀數與起訖時間
+    grouped = df.groupby('episode_index')['timestamp']
+    ts_agg = grouped.agg(frames='count', start='min', end='max')
+    durations = ts_agg['end'] - ts_agg['start']
+    actual_fps = np.where(durations > 0, (ts_agg['frames'] - 1) / durations.replace(0, np.nan), 0)
+
+    # 幀間隔: groupby內diff後再聚合 (每個episode的第一行是NaN，聚合時自動忽略)
+    intervals = grouped.diff()
+    int_grouped = intervals.groupby(df['episode_index'])
+    int_agg = int_grouped.agg(avg_interval='mean', min_interval='min', max_interval='max')
+    int_agg['std_interval'] = int_grouped.std(ddof=0)
+    int_agg = int_agg.fillna(0)
+
+    results_df = pd.DataFrame({
+        'episode': ts_agg.index,
+        'frames': ts_agg['frames'].values,
+        'duration': durations.values,
+        'actual_fps': actual_fps,
+        'target_fps': np.where(int_agg['avg_interval'] > 0, 1 / int_agg['avg_interval'].replace(0, np.nan), 0),
+        'avg_interval': int_agg['avg_interval'].values,
+        'std_interval': int_agg['std_interval'].values,
+        'min_interval': int_agg['min_interval'].values,
+        'max_interval': int_agg['max_interval'].values,
+    }).reset_index(drop=True)
+
+    for row in results_df.itertuples():
+        print(f"{row.episode:3d} | {row.frames:6d} | {ts_agg['start'].iloc[row.Index]:10.3f} | "
+              f"{ts_agg['end'].iloc[row.Index]:10.3f} | {row.duration:9.3f} | {row.actual_fps:8.2f} | {row.target_fps:8.2f}")
+
     print("="*80)
-    
-    # 整體統計
-    results_df = pd.DataFrame(results)
-    
+
     print(f"\n整體統計:")
     print(f"  實際FPS:")
     print(f"    - 平均: {results_df['actual_fps'].mean():.2f}")
@@ -4,9 +4,38 @@
 """
 import json
 from pathlib import Path
-import pyarrow.parquet as pq
+import os
+import pyarrow as pa
+import pyarrow.dataset as ds
 import numpy as np
-from collections import defaultdict
+
+try:
+    from numba import njit
+except ImportError:
+    _episode_interval_stats = None
+else:
+    @njit(cache=True, fastmath=True)
+    def _episode_interval_stats(ep_codes, ts, n_eps):
+        """單趟掃過排序後的timestamp，累出每個episode的間隔統計
+
+        ep_codes是0..n_eps-1的episode編號；跨episode邊界的間隔自動跳過
+        """
+        sums = np.zeros(n_eps)
+        sums_sq = np.zeros(n_eps)
+        mins = np.full(n_eps, np.inf)
+        maxs = np.full(n_eps, -np.inf)
+        for i in range(ts.size - 1):
+            e = ep_codes[i]
+            if ep_codes[i + 1] != e:
+                continue
+            d = ts[i + 1] - ts[i]
+            sums[e] += d
+            sums_sq[e] += d * d
+            if d < mins[e]:
+                mins[e] = d
+            if d > maxs[e]:
+                maxs[e] = d
+        return sums, sums_sq, mins, maxs
 
 def analyze_timestamps(dataset_path):
     """分析parquet數據中的timestamps"""
@@ -26,24 +55,26 @@ def analyze_timestamps(dataset_path):
     
     print(f"找到 {len(parquet_files)} 個parquet文件")
     
-    # 讀取所有數據
-    all_episodes = defaultdict(list)
-    total_rows = 0
-    columns = None
-    
-    for pf in sorted(parquet_files):
-        table = pq.read_table(pf)
-        if columns is None:
-            columns = table.column_names
-        
-        # 提取需要的列
-        episode_indices = table['episode_index'].to_pylist()
-        timestamps = table['timestamp'].to_pylist()
-        
-        for ep_idx, ts in zip(episode_indices, timestamps):
-            all_episodes[ep_idx].append(ts)
-            total_rows += 1
-    
+    # 提高Arrow的IO執行緒數，讓多個row-group讀取同時在隊列裡 (把NVMe的隊列深度吃滿)
+    pa.set_io_thread_count(min(32, (os.cpu_count() or 8) * 2))
+
+    # 一次掃描所有parquet文件，只投影需要的兩列
+    dataset = ds.dataset(sorted(parquet_files), format='parquet')
+    columns = dataset.schema.names
+    table = dataset.to_table(columns=['episode_index', 'timestamp'], use_threads=True)
+
+    # 保持numpy陣列，不逐行轉Python物件
+    # timestamp在arrow層就降到float32: 對秒級timestamp精度綽綽有餘，後面每個pass的頻寬減半
+    ep_arr = table['episode_index'].to_numpy(zero_copy_only=False)
+    ts_arr = table['timestamp'].cast(pa.float32()).to_numpy(zero_copy_only=False)
+    total_rows = len(ep_arr)
+
+    # 按episode穩定排序，每個episode在排序後的陣列中是一個連續區段
+    order = np.argsort(ep_arr, kind='stable')
+    ep_sorted = ep_arr[order]
+    ts_sorted = ts_arr[order]
+    unique_eps, starts = np.unique(ep_sorted, return_index=True)
+
     print(f"\n總共有 {total_rows} 條數據")
     print(f"Columns: {columns[:5]}..." if len(columns) > 5 else f"Columns: {columns}")
     
@@ -53,47 +84,64 @@ def analyze_timestamps(dataset_path):
     print(f"{'Ep':>3} | {'幀數':>6} | {'開始':>10} | {'結束':>10} | {'時長':>9} | {'實際FPS':>8} | {'avg間隔':>9} | {'std間隔':>9}")
     print("-"*90)
     
+    # 用reduceat對排序後的區段一次算出所有episode的統計，去掉per-episode的Python迴圈
+    n_eps = len(unique_eps)
+    next_starts = np.append(starts[1:], total_rows)
+    counts = next_starts - starts
+    start_times = ts_sorted[starts]
+    end_times = ts_sorted[next_starts - 1]
+    durations = end_times - start_times
+    actual_fps_arr = np.divide(counts - 1, durations, out=np.zeros(n_eps), where=durations > 0)
+
+    n_intervals = counts - 1
+    has_intervals = n_intervals > 0
+
+    if total_rows <= 1:
+        sums = sums_sq = mins = maxs = np.zeros(n_eps)
+    elif _episode_interval_stats is not None:
+        # numba單趟掃描: 只碰一次記憶體就算完所有區段統計
+        codes = np.repeat(np.arange(n_eps), counts)
+        sums, sums_sq, mins, maxs = _episode_interval_stats(codes, ts_sorted, n_eps)
+    else:
+        # 沒有numba時退回reduceat；跨episode邊界的diff不屬於任何episode，要遮掉
+        d = np.diff(ts_sorted)
+        boundary = next_starts[:-1] - 1
+        d_sum = d.copy()
+        d_sum[boundary] = 0.0
+        d_min = d.copy()
+        d_min[boundary] = np.inf
+        d_max = d.copy()
+        d_max[boundary] = -np.inf
+
+        ra_starts = np.minimum(starts, len(d) - 1)
+        sums = np.add.reduceat(d_sum, ra_starts)
+        sums_sq = np.add.reduceat(d_sum * d_sum, ra_starts)
+        mins = np.minimum.reduceat(d_min, ra_starts)
+        maxs = np.maximum.reduceat(d_max, ra_starts)
+
+    avg_intervals = np.divide(sums, n_intervals, out=np.zeros(n_eps), where=has_intervals)
+    # 用 E[x²]-E[x]² 算變異數 (間隔量級一致，精度足夠)
+    mean_sq = np.divide(sums_sq, n_intervals, out=np.zeros(n_eps), where=has_intervals)
+    std_intervals = np.sqrt(np.maximum(mean_sq - avg_intervals ** 2, 0.0))
+    min_intervals = np.where(has_intervals, mins, 0.0)
+    max_intervals = np.where(has_intervals, maxs, 0.0)
+
     results = []
-    
-    for ep_idx in sorted(all_episodes.keys()):
-        timestamps = np.array(all_episodes[ep_idx])
-        frame_count = len(timestamps)
-        
-        start_time = timestamps[0]
-        end_time = timestamps[-1]
-        duration = end_time - start_time
-        
-        if duration > 0:
-            actual_fps = (frame_count - 1) / duration
-        else:
-            actual_fps = 0
-        
-        # 計算幀間隔
-        if len(timestamps) > 1:
-            intervals = np.diff(timestamps)
-            avg_interval = np.mean(intervals)
-            std_interval = np.std(intervals)
-            min_interval = np.min(intervals)
-            max_interval = np.max(intervals)
-        else:
-            avg_interval = 0
-            std_interval = 0
-            min_interval = 0
-            max_interval = 0
-        
+
+    for i, ep_idx in enumerate(unique_eps):
         results.append({
             'episode': ep_idx,
-            'frames': frame_count,
-            'duration': duration,
-            'actual_fps': actual_fps,
-            'avg_interval': avg_interval,
-            'std_interval': std_interval,
-            'min_interval': min_interval,
-            'max_interval': max_interval
+            'frames': int(counts[i]),
+            'duration': durations[i],
+            'actual_fps': actual_fps_arr[i],
+            'avg_interval': avg_intervals[i],
+            'std_interval': std_intervals[i],
+            'min_interval': min_intervals[i],
+            'max_interval': max_intervals[i]
         })
-        
-        print(f"{ep_idx:3d} | {frame_count:6d} | {start_time:10.3f} | {end_time:10.3f} | "
-              f"{duration:8.2f}s | {actual_fps:8.2f} | {avg_interval:8.4f}s | {std_interval:8.4f}s")
+
+        print(f"{ep_idx:3d} | {counts[i]:6d} | {start_times[i]:10.3f} | {end_times[i]:10.3f} | "
+              f"{durations[i]:8.2f}s | {actual_fps_arr[i]:8.2f} | {avg_intervals[i]:8.4f}s | {std_intervals[i]:8.4f}s")
     
     print("="*90)
     
@@ -16,12 +16,16 @@ Key changes:
 import argparse
 import json
 import logging
+import os
 import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import jsonlines
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from huggingface_hub import HfApi, snapshot_download
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,113 +36,172 @@ V30 = "v3.0"
 
 def load_v21_episodes(root: Path) -> pd.DataFrame:
     """Load v2.1 episodes.jsonl as DataFrame."""
-    episodes = []
-    with jsonlines.open(root / "meta/episodes.jsonl") as reader:
-        for item in reader:
-            episodes.append(item)
-    return pd.DataFrame(episodes)
+    # pandas parses the whole file in its C json engine, no per-line Python loop
+    return pd.read_json(root / "meta/episodes.jsonl", lines=True)
 
 
 def load_v21_episodes_stats(root: Path) -> dict:
     """Load v2.1 episodes_stats.jsonl."""
-    stats = {}
-    with jsonlines.open(root / "meta/episodes_stats.jsonl") as reader:
-        for item in reader:
-            ep_idx = item["episode_index"]
-            stats[ep_idx] = item["stats"]
-    return stats
+    df = pd.read_json(root / "meta/episodes_stats.jsonl", lines=True)
+    return dict(zip(df["episode_index"], df["stats"]))
 
 
 def load_v21_tasks(root: Path) -> pd.DataFrame:
     """Load v2.1 tasks.jsonl as DataFrame."""
-    tasks = []
-    with jsonlines.open(root / "meta/tasks.jsonl") as reader:
-        for item in reader:
-            tasks.append({"task_index": item["task_index"], "task": item["task"]})
-    df = pd.DataFrame(tasks)
-    return df.set_index("task")  # task as index, task_index as column
+    df = pd.read_json(root / "meta/tasks.jsonl", lines=True)
+    return df[["task_index", "task"]].set_index("task")  # task as index, task_index as column
+
+
+QUANTILE_NAMES = ["q01", "q10", "q50", "q90", "q99"]
+QUANTILE_QS = [0.01, 0.10, 0.50, 0.90, 0.99]
 
 
 def compute_quantiles(data: np.ndarray) -> dict:
     """Compute quantiles for v3.0 format."""
-    return {
-        "q01": np.quantile(data, 0.01, axis=0).tolist(),
-        "q10": np.quantile(data, 0.10, axis=0).tolist(),
-        "q50": np.quantile(data, 0.50, axis=0).tolist(),
-        "q90": np.quantile(data, 0.90, axis=0).tolist(),
-        "q99": np.quantile(data, 0.99, axis=0).tolist(),
-    }
-
-
-def compute_global_stats_from_episodes(episodes_stats: dict, features: dict) -> dict:
-    """Aggregate per-episode stats into global stats for v3.0."""
-    global_stats = {}
-    
-    # Get all feature names from first episode
-    first_ep_stats = list(episodes_stats.values())[0]
-    feature_names = list(first_ep_stats.keys())
-    
-    for feat_name in feature_names:
-        # Collect all data for this feature across episodes
-        all_mins = []
-        all_maxs = []
-        all_means = []
-        all_stds = []
-        all_counts = []
-        
-        for ep_stats in episodes_stats.values():
-            if feat_name not in ep_stats:
+    data = np.asarray(data, dtype=np.float64)
+    n = data.shape[0]
+    if n == 1:
+        return {name: data[0].tolist() for name in QUANTILE_NAMES}
+
+    # Multi-select via np.partition instead of the full sort np.quantile can
+    # fall back to for a vector of probabilities. Linear interpolation needs
+    # the floor and ceil order statistics of each quantile position.
+    positions = np.asarray(QUANTILE_QS) * (n - 1)
+    lo = np.floor(positions).astype(np.intp)
+    hi = np.ceil(positions).astype(np.intp)
+    part = np.partition(data, np.unique(np.concatenate([lo, hi])), axis=0)
+
+    frac = (positions - lo).reshape((-1,) + (1,) * (data.ndim - 1))
+    qs = part[lo] + (part[hi] - part[lo]) * frac
+    return {name: qs[i].tolist() for i, name in enumerate(QUANTILE_NAMES)}
+
+
+class GlobalStatsAccumulator:
+    """Accumulate global stats online while episodes are being processed.
+
+    Same aggregation as before (elementwise min/max, count-weighted mean and
+    count-weighted mean of variances), but maintained as running sums that
+    are updated once per episode inside the episodes loop instead of a
+    separate second pass over all episode stats at the end.
+    """
+
+    def __init__(self):
+        self._acc = {}
+
+    def update(self, ep_stats: dict) -> None:
+        for feat_name, feat_stats in ep_stats.items():
+            mins = np.asarray(feat_stats["min"], dtype=np.float64)
+            maxs = np.asarray(feat_stats["max"], dtype=np.float64)
+            means = np.asarray(feat_stats["mean"], dtype=np.float64)
+            stds = np.asarray(feat_stats["std"], dtype=np.float64)
+            counts = np.asarray(feat_stats["count"])
+            # Scalar counts weight directly; per-dim counts share one value
+            weight = float(counts) if counts.ndim == 0 else float(counts.flat[0])
+
+            acc = self._acc.get(feat_name)
+            if acc is None:
+                self._acc[feat_name] = {
+                    "min": mins.copy(),
+                    "max": maxs.copy(),
+                    "weighted_mean": weight * means,
+                    "weighted_var": weight * stds**2,
+                    "weight": weight,
+                    "count": counts.astype(np.int64),
+                }
+            else:
+                np.minimum(acc["min"], mins, out=acc["min"])
+                np.maximum(acc["max"], maxs, out=acc["max"])
+                acc["weighted_mean"] += weight * means
+                acc["weighted_var"] += weight * stds**2
+                acc["weight"] += weight
+                acc["count"] += counts
+
+    def finalize(self) -> dict:
+        global_stats = {}
+        for feat_name, acc in self._acc.items():
+            count = acc["count"]
+            global_stats[feat_name] = {
+                "min": acc["min"].tolist(),
+                "max": acc["max"].tolist(),
+                "mean": (acc["weighted_mean"] / acc["weight"]).tolist(),
+                "std": np.sqrt(acc["weighted_var"] / acc["weight"]).tolist(),
+                "count": count.tolist() if count.ndim > 0 else [int(count)],
+            }
+        return global_stats
+
+
+def list_episode_files(directory: Path, suffix: str) -> list:
+    """Sorted episode_* files in a directory from a single os.scandir pass.
+
+    scandir reads each entry in one syscall, unlike glob's match-then-stat,
+    which matters for directories with tens of thousands of episodes.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            names = sorted(e.name for e in entries if e.name.startswith("episode_") and e.name.endswith(suffix))
+    except FileNotFoundError:
+        return []
+    return [directory / name for name in names]
+
+
+def read_episode_metadata(ep_file: Path) -> tuple:
+    """Read (num_rows, from_timestamp, to_timestamp) from the parquet footer.
+
+    Timestamps are monotonic within an episode, so the row-group min/max
+    statistics equal the first/last values without decoding any pages.
+    """
+    meta = pq.ParquetFile(ep_file).metadata
+    ts_col = next(i for i in range(meta.num_columns) if meta.schema.column(i).name == "timestamp")
+    ts_min = min(meta.row_group(g).column(ts_col).statistics.min for g in range(meta.num_row_groups))
+    ts_max = max(meta.row_group(g).column(ts_col).statistics.max for g in range(meta.num_row_groups))
+    return meta.num_rows, float(ts_min), float(ts_max)
+
+
+def feature_array(table, feat_name: str) -> np.ndarray:
+    """Extract a feature column as a stacked (n, dim) numpy array.
+
+    Fixed-width list columns reshape straight from the flat arrow buffer;
+    nothing iterates row by row in Python.
+    """
+    col = table[feat_name].combine_chunks()
+    if pa.types.is_fixed_size_list(col.type):
+        return col.values.to_numpy(zero_copy_only=False).reshape(len(col), col.type.list_size)
+    if pa.types.is_list(col.type):
+        return np.stack(col.to_numpy(zero_copy_only=False))
+    return col.to_numpy(zero_copy_only=False)
+
+
+def compute_all_episode_quantiles(ep_tables: dict, features: dict) -> dict:
+    """Compute per-episode quantiles for every non-video feature.
+
+    Consumes the arrow tables already loaded during the merge pass, so no
+    episode parquet is re-read. Returns
+    {episode_index: {feat_name: {"q01": ..., ...}}}.
+    """
+    all_quantiles = {}
+    for ep_idx, table in ep_tables.items():
+        ep_quantiles = {}
+        for feat_name, feat_info in features.items():
+            if feat_info.get("dtype") == "video" or feat_name not in table.column_names:
                 continue
-            feat_stats = ep_stats[feat_name]
-            all_mins.append(feat_stats["min"])
-            all_maxs.append(feat_stats["max"])
-            all_means.append(feat_stats["mean"])
-            all_stds.append(feat_stats["std"])
-            all_counts.append(feat_stats["count"])
-        
-        # Convert to arrays
-        all_mins = np.array(all_mins)
-        all_maxs = np.array(all_maxs)
-        all_means = np.array(all_means)
-        all_stds = np.array(all_stds)
-        all_counts = np.array(all_counts)
-        
-        # Handle scalar counts (for features with single dimension)
-        if all_counts.ndim == 1:
-            # counts is 1D array of scalars
-            weights = all_counts
-        else:
-            # counts is 2D array, use first column if all same
-            weights = all_counts[:, 0] if all_counts.shape[1] > 0 else all_counts
-        
-        # Compute global stats
-        global_stats[feat_name] = {
-            "min": np.min(all_mins, axis=0).tolist(),
-            "max": np.max(all_maxs, axis=0).tolist(),
-            "mean": np.average(all_means, axis=0, weights=weights).tolist(),
-            "std": np.sqrt(np.average(all_stds**2, axis=0, weights=weights)).tolist(),
-            "count": np.sum(all_counts, axis=0).tolist() if all_counts.ndim > 1 else [int(np.sum(all_counts))],
-        }
-    
-    return global_stats
+            ep_quantiles[feat_name] = compute_quantiles(feature_array(table, feat_name))
+        all_quantiles[ep_idx] = ep_quantiles
+    return all_quantiles
 
 
-def add_quantiles_to_episode_stats(ep_stats: dict, df_episode: pd.DataFrame, features: dict) -> dict:
+def add_quantiles_to_episode_stats(ep_stats: dict, ep_quantiles: dict, features: dict) -> dict:
     """Add quantile statistics to episode stats for v3.0 format."""
     for feat_name, feat_info in features.items():
         # Skip features not in episode stats
         if feat_name not in ep_stats:
             continue
-            
+
         # For video features, we can't compute quantiles from data (not in parquet)
         # But we can still add quantiles to their stats if they exist
         if feat_info.get("dtype") == "video":
             # Video stats come from v2.1 episodes_stats, just add empty quantiles to maintain structure
             if feat_name in ep_stats and feat_name in features:
-                # Get the shape from existing stats
                 if "min" in ep_stats[feat_name]:
-                    min_val = ep_stats[feat_name]["min"]
-                    shape = np.array(min_val).shape
                     # Add quantiles as copies of min/max for video stats
                     ep_stats[feat_name]["q01"] = ep_stats[feat_name]["min"]
                     ep_stats[feat_name]["q10"] = ep_stats[feat_name]["min"]
@@ -146,16 +209,11 @@ def add_quantiles_to_episode_stats(ep_stats: dict, df_episode: pd.DataFrame, fea
                     ep_stats[feat_name]["q90"] = ep_stats[feat_name]["max"]
                     ep_stats[feat_name]["q99"] = ep_stats[feat_name]["max"]
             continue
-        
-        # For non-video features in data parquet, compute real quantiles
-        if feat_name in df_episode.columns:
-            # Get data for this feature from episode
-            data = np.array([row for row in df_episode[feat_name]])
-            
-            # Add quantiles
-            quantiles = compute_quantiles(data)
-            ep_stats[feat_name].update(quantiles)
-    
+
+        # Quantiles were precomputed for all episodes in one pass
+        if feat_name in ep_quantiles:
+            ep_stats[feat_name].update(ep_quantiles[feat_name])
+
     return ep_stats
 
 
@@ -198,109 +256,159 @@ def convert_to_v30(root: Path, new_root: Path):
     v21_tasks.to_parquet(new_root / "meta/tasks.parquet")
     
     # 4. Merge and convert data files (v2.1 has one file per episode, v3.0 has one combined file)
+    # Stream each episode's arrow table straight into the combined writer:
+    # no pandas materialization and no pd.concat double-allocation.
     logging.info("Converting and merging data files...")
-    all_episodes_data = []
-    for ep_file in sorted((root / "data/chunk-000").glob("episode_*.parquet")):
-        df = pd.read_parquet(ep_file)
-        all_episodes_data.append(df)
-    
-    df_combined = pd.concat(all_episodes_data, ignore_index=True)
-    df_combined.to_parquet(new_root / "data/chunk-000/file-000.parquet", index=False)
+    ep_files = list_episode_files(root / "data/chunk-000", ".parquet")
+
+    # Read episodes in parallel (arrow releases the GIL); writes stay ordered
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 8) * 4)) as executor:
+        tables = list(executor.map(lambda f: pq.read_table(f, use_threads=True), ep_files))
+
+    ep_tables = {}
+    ep_meta = {}  # episode_index -> (num_rows, from_timestamp, to_timestamp), footer-only
+    writer = None
+    for ep_file, table in zip(ep_files, tables):
+        if writer is None:
+            # zstd + dictionary encoding roughly halve the file vs snappy
+            # defaults on low-cardinality robot columns; written statistics
+            # let later readers prune row groups
+            writer = pq.ParquetWriter(
+                new_root / "data/chunk-000/file-000.parquet",
+                table.schema,
+                compression="zstd",
+                compression_level=3,
+                use_dictionary=True,
+                data_page_size=1 << 20,
+                write_statistics=True,
+            )
+        # Stream in bounded batches so row groups stay a predictable size
+        for batch in table.to_batches(max_chunksize=64_000):
+            writer.write_batch(batch)
+        ep_idx = int(ep_file.stem.split("_")[1])
+        ep_tables[ep_idx] = table
+        ep_meta[ep_idx] = read_episode_metadata(ep_file)
+    if writer is not None:
+        writer.close()
+
+    # Compute quantiles for all episodes from the loaded tables in one pass
+    logging.info("Computing per-episode quantiles...")
+    all_quantiles = compute_all_episode_quantiles(ep_tables, info["features"])
     
     # 5. Merge and convert video files (requires ffmpeg)
     logging.info("Converting video files...")
     video_keys = [k for k, v in info["features"].items() if v.get("dtype") == "video"]
-    for video_key in video_keys:
+
+    def merge_camera_videos(video_key):
         old_video_dir = root / f"videos/chunk-000/{video_key}"
         new_video_dir = new_root / f"videos/{video_key}/chunk-000"
         new_video_dir.mkdir(parents=True, exist_ok=True)
-        
+
         # Find all episode video files for this camera
-        old_videos = sorted(old_video_dir.glob("episode_*.mp4"))
-        if old_videos:
-            # Create concat file for ffmpeg
-            concat_file = new_root / f"concat_{video_key}.txt"
-            with open(concat_file, "w") as f:
-                for video in old_videos:
-                    f.write(f"file '{video.absolute()}'\n")
-            
-            # Merge videos with ffmpeg
-            new_video_file = new_video_dir / "file-000.mp4"
-            import subprocess
-            try:
-                subprocess.run([
-                    "ffmpeg", "-f", "concat", "-safe", "0", 
-                    "-i", str(concat_file), 
-                    "-c", "copy", str(new_video_file)
-                ], check=True, capture_output=True)
-                concat_file.unlink()  # Clean up
-                logging.info(f"✓ Merged {len(old_videos)} videos for {video_key}")
-            except Exception as e:
-                logging.warning(f"⚠ Video merge failed for {video_key}: {e}")
-                logging.warning("Copying first video only as fallback")
-                shutil.copy(old_videos[0], new_video_file)
+        old_videos = list_episode_files(old_video_dir, ".mp4")
+        if not old_videos:
+            return
+
+        # Feed the concat list over stdin: no temp file, and ffmpeg's chatter
+        # goes to /dev/null instead of being buffered in RAM
+        concat_list = "".join(f"file '{video.absolute()}'\n" for video in old_videos).encode()
+
+        # Merge videos with ffmpeg
+        new_video_file = new_video_dir / "file-000.mp4"
+        try:
+            subprocess.run([
+                "ffmpeg", "-f", "concat", "-safe", "0",
+                "-protocol_whitelist", "pipe,file",
+                "-i", "pipe:0",
+                "-c", "copy", str(new_video_file)
+            ], input=concat_list, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            logging.info(f"✓ Merged {len(old_videos)} videos for {video_key}")
+        except Exception as e:
+            logging.warning(f"⚠ Video merge failed for {video_key}: {e}")
+            logging.warning("Copying first video only as fallback")
+            shutil.copy(old_videos[0], new_video_file)
+
+    # One ffmpeg per camera; "-c copy" merges are I/O-bound, so running the
+    # cameras concurrently scales with disk bandwidth. Threads are enough
+    # since the work happens in child ffmpeg processes.
+    if video_keys:
+        with ThreadPoolExecutor(max_workers=len(video_keys)) as executor:
+            list(executor.map(merge_camera_videos, video_keys))
     
     # 6. Create episodes parquet with quantiles
     logging.info("Creating episodes parquet with quantiles...")
-    episodes_data = []
-    cumulative_index = 0  # Track dataset indices
-    
+    global_stats_acc = GlobalStatsAccumulator()
+
+    # Dataset index ranges come from one cumsum over the footer lengths
+    # instead of a running counter carried through the loop
+    meta_eps = sorted(ep_meta)
+    lengths = np.fromiter((ep_meta[e][0] for e in meta_eps), dtype=np.int64, count=len(meta_eps))
+    tos = np.cumsum(lengths)
+    froms = tos - lengths
+    ep_ranges = {e: (int(froms[i]), int(tos[i])) for i, e in enumerate(meta_eps)}
+
     # Get video keys
     video_keys = [k for k, v in info["features"].items() if v.get("dtype") == "video"]
-    
-    for idx, row in v21_episodes.iterrows():
-        ep_idx = row["episode_index"]
-        ep_dict = row.to_dict()
-        
-        # Get episode stats
+
+    # Column-major assembly: every output key owns one preallocated column,
+    # so no per-row dict grows or rehashes and pandas infers each dtype from
+    # a whole column at once. The v2.1 columns seed the dict zero-copy.
+    num_episodes = len(v21_episodes)
+    columns = {key: v21_episodes[key].tolist() for key in v21_episodes.columns}
+
+    def set_col(key, i, value):
+        col = columns.get(key)
+        if col is None:
+            col = columns[key] = [None] * num_episodes
+        col[i] = value
+
+    for i, ep_idx in enumerate(v21_episodes["episode_index"].tolist()):
+        # Get episode stats and fold them into the global running stats
         ep_stats = v21_episodes_stats.get(ep_idx, {})
-        
-        # Load episode data for quantile computation (v2.1 has one file per episode)
-        ep_file = root / "data/chunk-000" / f"episode_{ep_idx:06d}.parquet"
-        if ep_file.exists():
-            df_episode = pd.read_parquet(ep_file)
-            
+        global_stats_acc.update(ep_stats)
+
+        # Length and timestamp range come from the parquet footer statistics
+        # collected during the merge pass; no column data is touched here.
+        meta_row = ep_meta.get(ep_idx)
+        if meta_row is not None:
             # Add quantiles to stats
-            ep_stats_with_q = add_quantiles_to_episode_stats(ep_stats, df_episode, info["features"])
-            
+            ep_stats_with_q = add_quantiles_to_episode_stats(ep_stats, all_quantiles.get(ep_idx, {}), info["features"])
+
             # Add data file indices
-            ep_dict["data/chunk_index"] = 0
-            ep_dict["data/file_index"] = 0
-            
+            set_col("data/chunk_index", i, 0)
+            set_col("data/file_index", i, 0)
+
             # Add dataset range indices
-            ep_length = len(df_episode)
-            ep_dict["dataset_from_index"] = cumulative_index
-            ep_dict["dataset_to_index"] = cumulative_index + ep_length
-            cumulative_index += ep_length
-            
+            from_timestamp, to_timestamp = meta_row[1:]
+            from_index, to_index = ep_ranges[ep_idx]
+            set_col("dataset_from_index", i, from_index)
+            set_col("dataset_to_index", i, to_index)
+
             # Add video metadata for each camera
             for video_key in video_keys:
-                ep_dict[f"videos/{video_key}/chunk_index"] = 0
-                ep_dict[f"videos/{video_key}/file_index"] = 0
-                # Calculate timestamps from frame data
-                timestamps = df_episode["timestamp"].values
-                ep_dict[f"videos/{video_key}/from_timestamp"] = float(timestamps[0])
-                ep_dict[f"videos/{video_key}/to_timestamp"] = float(timestamps[-1])
+                set_col(f"videos/{video_key}/chunk_index", i, 0)
+                set_col(f"videos/{video_key}/file_index", i, 0)
+                set_col(f"videos/{video_key}/from_timestamp", i, from_timestamp)
+                set_col(f"videos/{video_key}/to_timestamp", i, to_timestamp)
         else:
             ep_stats_with_q = ep_stats
-        
-        # Flatten stats into episode dict
+
+        # Flatten stats into per-key columns
         for feat_name, feat_stats in ep_stats_with_q.items():
             for stat_name, stat_value in feat_stats.items():
-                ep_dict[f"stats/{feat_name}/{stat_name}"] = stat_value
-        
-        # Add metadata fields
-        ep_dict["meta/episodes/chunk_index"] = 0
-        ep_dict["meta/episodes/file_index"] = 0
-        
-        episodes_data.append(ep_dict)
-    
-    df_episodes = pd.DataFrame(episodes_data)
+                set_col(f"stats/{feat_name}/{stat_name}", i, stat_value)
+
+    # Add metadata fields (constant across episodes)
+    columns["meta/episodes/chunk_index"] = [0] * num_episodes
+    columns["meta/episodes/file_index"] = [0] * num_episodes
+
+    df_episodes = pd.DataFrame(columns)
     df_episodes.to_parquet(new_root / "meta/episodes/chunk-000/file-000.parquet", index=False)
     
     # 8. Create global stats.json
     logging.info("Creating global stats...")
-    global_stats = compute_global_stats_from_episodes(v21_episodes_stats, info["features"])
+    global_stats = global_stats_acc.finalize()
     with open(new_root / "meta/stats.json", "w") as f:
         json.dump(global_stats, f, indent=4)
     
@@ -7,6 +7,8 @@ import time
 import os
 from pathlib import Path
 
+import numpy as np
+
 def monitor_system_resources(duration_seconds=300, interval_seconds=5):
     """
     監控系統資源使用情況
@@ -27,16 +29,26 @@ def monitor_system_resources(duration_seconds=300, interval_seconds=5):
     # 記錄初始磁碟IO
     disk_io_start = psutil.disk_io_counters()
     
-    data_points = []
-    start_time = time.time()
-    
+    # 預先配好numpy陣列，每個tick只寫一個slot，不再每次配dict
+    # (只有cpu和記憶體會進統計分析，其他指標印完就丟)
+    n_samples = int(duration_seconds / interval_seconds)
+    cpu_arr = np.empty(n_samples)
+    mem_arr = np.empty(n_samples)
+    count = 0
+
+    # 先prime一次，之後interval=None直接回傳上次呼叫以來的平均，不再阻塞1秒
+    psutil.cpu_percent(interval=None)
+
+    # 固定tick排程: 以monotonic時鐘對齊，不會因採樣耗時而漂移
+    start_time = time.monotonic()
+
     try:
-        for i in range(int(duration_seconds / interval_seconds)):
-            current_time = time.time() - start_time
-            
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
+        for i in range(n_samples):
+            current_time = time.monotonic() - start_time
+
+            # CPU使用率 (自上個tick以來的平均)
+            cpu_percent = psutil.cpu_percent(interval=None)
+
             # 記憶體使用率
             mem = psutil.virtual_memory()
             mem_percent = mem.percent
@@ -54,24 +66,18 @@ def monitor_system_resources(duration_seconds=300, interval_seconds=5):
             disk_io_start = disk_io_end
             
             # 記錄數據
-            data_point = {
-                'time': current_time,
-                'cpu': cpu_percent,
-                'mem_percent': mem_percent,
-                'mem_mb': mem_used_mb,
-                'available_mb': mem_available_mb,
-                'swap': swap_percent,
-                'disk_read': disk_read_mb,
-                'disk_write': disk_write_mb
-            }
-            data_points.append(data_point)
-            
+            cpu_arr[i] = cpu_percent
+            mem_arr[i] = mem_used_mb
+            count = i + 1
+
+
             # 打印
             print(f"{current_time:8.1f} | {cpu_percent:6.1f} | {mem_percent:7.1f} | "
                   f"{mem_used_mb:9.1f} | {mem_available_mb:8.1f} | {swap_percent:6.1f} | "
                   f"{disk_read_mb:11.2f} | {disk_write_mb:11.2f}")
             
-            time.sleep(interval_seconds)
+            next_tick = start_time + (i + 1) * interval_seconds
+            time.sleep(max(0, next_tick - time.monotonic()))
     
     except KeyboardInterrupt:
         print("\n監控被中斷")
@@ -79,14 +85,12 @@ def monitor_system_resources(duration_seconds=300, interval_seconds=5):
     print("=" * 100)
     
     # 統計分析
-    if len(data_points) > 1:
+    if count > 1:
         print("\n📊 統計分析:")
-        
-        import numpy as np
-        
-        cpu_values = [d['cpu'] for d in data_points]
-        mem_values = [d['mem_mb'] for d in data_points]
-        
+
+        cpu_values = cpu_arr[:count]
+        mem_values = mem_arr[:count]
+
         print(f"\nCPU使用率:")
         print(f"  平均: {np.mean(cpu_values):.1f}%")
         print(f"  最大: {np.max(cpu_values):.1f}%")
@@ -101,9 +105,7 @@ def monitor_system_resources(duration_seconds=300, interval_seconds=5):
         # 檢測記憶體洩漏
         if len(mem_values) >= 3:
             # 簡單線性回歸檢測趨勢
-            x = np.array(range(len(mem_values)))
-            y = np.array(mem_values)
-            slope = np.polyfit(x, y, 1)[0]
+            slope = np.polyfit(np.arange(count), mem_values, 1)[0]
             
             if slope > 1:  # 每次採樣增長超過1MB
                 print(f"\n⚠️  警告: 檢測到記憶體持續增長，速率: {slope:.2f} MB/採樣")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+錄製壓力測試 - 測試N個相機同時以30fps錄製時的系統負載
+找出掉幀的原因（相機讀取、預覽、還是存檔）
+"""
+import argparse
+import multiprocessing as mp
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from lerobot.cameras.opencv import OpenCVCamera, OpenCVCameraConfig
+
+
+def _rolling_fps(ts_buf, head, count):
+    """ring buffer裡最舊到最新樣本之間的平均fps"""
+    if count < 2:
+        return 0.0
+    size = ts_buf.shape[0]
+    span_ns = ts_buf[(head - 1) % size] - ts_buf[(head - count) % size]
+    if span_ns <= 0:
+        return 0.0
+    return (count - 1) * 1e9 / span_ns
+
+
+try:
+    from numba import njit
+except ImportError:
+    pass  # 沒numba就用純Python版，邏輯相同
+else:
+    # eager signature: import時就編好，不會在主迴圈裡觸發JIT暖機
+    _rolling_fps = njit("float64(int64[:], int64, int64)", cache=True, fastmath=True)(_rolling_fps)
+
+
+class FPSCounter:
+    """滑動窗口FPS計數器 - 固定int64 ring buffer，tick只寫一個slot"""
+
+    def __init__(self, window_size=30):
+        self.ts_buf = np.empty(window_size, dtype=np.int64)
+        self.head = 0
+        self.count = 0
+
+    def tick(self):
+        self.ts_buf[self.head % len(self.ts_buf)] = time.perf_counter_ns()
+        self.head += 1
+        if self.count < len(self.ts_buf):
+            self.count += 1
+
+    def get_fps(self):
+        return _rolling_fps(self.ts_buf, self.head, self.count)
+
+
+def _saver_proc(shm_name, ring_shape, frame_queue, free_slots, saved_counter):
+    """存檔子行程主體: 只靠slot編號取用shared memory裡的幀，寫完歸還slot"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray(ring_shape, dtype=np.uint8, buffer=shm.buf)
+    running = True
+    while running:
+        slots = [frame_queue.get()]
+        if slots[0] is None:
+            break
+        # 一次撈一批，攤平固定寫入開銷
+        try:
+            while len(slots) < 32:
+                slots.append(frame_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if slots[-1] is None:
+            running = False
+            slots.pop()
+        for slot in slots:
+            _ = ring[slot]  # 真實版本在這裡做pyarrow序列化+寫檔
+        # 模擬批次寫入: 固定開銷約10ms + 每筆1ms
+        time.sleep(0.010 + 0.001 * len(slots))
+        with saved_counter.get_lock():
+            saved_counter.value += len(slots)
+        # 寫完才歸還slot，producer拿不到free slot就知道要丟幀
+        for slot in slots:
+            free_slots.put(slot)
+    shm.close()
+
+
+class DataSaver:
+    """子行程存檔器 - 模擬非同步episode寫入
+
+    序列化/寫檔的Python工作搬到獨立行程，完全不跟擷取迴圈搶GIL。
+    幀資料放在shared memory的固定slot環，行程間只傳slot編號。
+    """
+
+    SLOTS = 8
+
+    def __init__(self, n_cams, height=480, width=640):
+        self.ring_shape = (self.SLOTS, n_cams, height, width, 3)
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(self.ring_shape)))
+        self.ring = np.ndarray(self.ring_shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.queue = mp.Queue()
+        # slot的所有權靠這個free佇列流轉: producer取用、saver寫完歸還，
+        # 不會覆寫還在排隊的slot
+        self.free_slots = mp.Queue()
+        for slot in range(self.SLOTS):
+            self.free_slots.put(slot)
+        self._saved = mp.Value('i', 0)
+        self.proc = mp.Process(
+            target=_saver_proc,
+            args=(self.shm.name, self.ring_shape, self.queue, self.free_slots, self._saved),
+            daemon=True)
+        self.proc.start()
+
+    @property
+    def saved_count(self):
+        return self._saved.value
+
+    def acquire_slot(self):
+        """拿一個saver已釋放的slot; 全部都還在排隊就回傳None (該幀要丟棄)"""
+        try:
+            return self.free_slots.get_nowait()
+        except queue.Empty:
+            return None
+
+    def commit(self, slot):
+        """slot填完後丟編號給子行程，queue上只有一個int在跑"""
+        self.queue.put(slot)
+
+    def stop(self):
+        self.queue.put(None)
+        self.proc.join(timeout=5.0)
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _print_latency_stats(title, arr_ns):
+    """ns陣列轉一次ms float，所有統計+percentile都算在同一個陣列上"""
+    ms = arr_ns / 1e6
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    print(f"\n{title} (ms):")
+    print(f"  平均: {ms.mean():.2f}")
+    print(f"  最小: {ms.min():.2f}")
+    print(f"  最大: {ms.max():.2f}")
+    print(f"  標準差: {ms.std():.2f}")
+    print(f"  p50/p95/p99: {p50:.2f} / {p95:.2f} / {p99:.2f}")
+
+
+def _set_timer_slack_ns(ns=50_000):
+    """用prctl降低kernel timer slack，讓短sleep醒得更準 (失敗就跳過，只影響配速精度)"""
+    try:
+        import ctypes
+        PR_SET_TIMERSLACK = 29
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_TIMERSLACK, ns, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+
+def pace_to(deadline_ns):
+    """混合配速: 粗睡到deadline前~0.8ms，剩下用spin補足
+
+    純time.sleep在Linux有~1ms的喚醒誤差 (timer granularity + 排程jitter)，
+    粗睡+細spin把誤差壓到<100µs。
+    """
+    remaining_ns = deadline_ns - time.perf_counter_ns()
+    if remaining_ns > 800_000:
+        time.sleep((remaining_ns - 800_000) / 1e9)
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+
+def stress_test_recording(camera_indices, duration_seconds=60, target_fps=30, preview=False):
+    """N相機錄製主迴圈"""
+    print(f"📹 錄製壓力測試: {len(camera_indices)}個相機, {duration_seconds}秒, 目標{target_fps}fps")
+    print("=" * 80)
+
+    cameras = {}
+    for idx in camera_indices:
+        config = OpenCVCameraConfig(index_or_path=idx, fps=target_fps, width=640, height=480)
+        cam = OpenCVCamera(config)
+        cam.connect()
+        cameras[idx] = cam
+        print(f"📷 相機 {idx} 已連接")
+
+    fps_counters = {idx: FPSCounter() for idx in cameras}
+    loop_fps = FPSCounter()
+    saver = DataSaver(n_cams=len(cameras))
+
+    # 統計buffer預先配好，迴圈內只做index寫入
+    # (list append每幀裝箱一個float還會週期性resize)
+    max_iters = int(duration_seconds * target_fps * 2) + 16
+    loop_times = np.empty(max_iters, dtype=np.int64)
+    camera_read_times = np.empty(max_iters, dtype=np.int64)
+    queue_sizes = np.empty(max_iters, dtype=np.int32)
+
+    # async_read在等相機背景執行緒的幀 (等待時放掉GIL)，
+    # N個相機的等待用常駐pool重疊: 總時間從sum變成max
+    camera_pool = ThreadPoolExecutor(max_workers=len(cameras))
+
+    # 暖機: 跟主迴圈一樣並行讀。async_read本來就會等到真實幀，不需要額外sleep
+    print("🔥 暖機中...")
+    for _ in range(10):
+        for future in [camera_pool.submit(cam.async_read, timeout_ms=1000)
+                       for cam in cameras.values()]:
+            future.result()
+
+    # 預覽buffer只配置一次，cvtColor每幀原地寫入 (省掉每幀~920KB的新陣列)
+    preview_buf = np.empty((480, 640, 3), np.uint8)
+
+    # saver把所有slot都佔住時的scratch目標: 照樣讀相機 (fps統計不失真)，幀丟棄
+    drop_buf = np.empty((len(cameras), 480, 640, 3), np.uint8)
+    dropped = 0
+
+
+    # 迴圈內全用整數ns計時: perf_counter_ns比float版便宜，整數差值沒有捨入
+    duration_ns = int(duration_seconds * 1e9)
+    target_period_ns = int(1e9 / target_fps)
+    _set_timer_slack_ns()
+    start_ns = time.perf_counter_ns()
+    next_deadline_ns = start_ns + target_period_ns
+    last_print_ns = start_ns
+    iteration = 0
+
+    # 熱路徑的屬性查找先綁到local: LOAD_FAST比LOAD_ATTR/全域查找便宜
+    pc_ns = time.perf_counter_ns
+    submit = camera_pool.submit
+    cam_reads = [(pos, idx, cam.async_read, fps_counters[idx].tick)
+                 for pos, (idx, cam) in enumerate(cameras.items())]
+    # 相機讀到的幀直接寫進shared memory ring的slot，省掉中繼stack的第二次copy；
+    # 佇列上只傳slot編號 (固定buffer池，主迴圈完全零heap配置)
+    ring = saver.ring
+    acquire_slot = saver.acquire_slot
+    commit = saver.commit
+    qsize = saver.queue.qsize
+    loop_tick = loop_fps.tick
+
+    try:
+        while iteration < max_iters and pc_ns() - start_ns < duration_ns:
+            i = iteration
+            loop_start_ns = pc_ns()
+
+            # 讀取所有相機 (並行)，結果直接copy進ring slot裡自己那一列
+            t0 = pc_ns()
+            slot = acquire_slot()
+            dst = ring[slot] if slot is not None else drop_buf
+            futures = {submit(read, timeout_ms=1000): (pos, tick)
+                       for pos, idx, read, tick in cam_reads}
+            for future in as_completed(futures):
+                pos, tick = futures[future]
+                np.copyto(dst[pos], future.result())
+                tick()
+            camera_read_times[i] = pc_ns() - t0
+
+            # 預覽 (只顯示第一個相機)
+            if preview:
+                cv2.cvtColor(dst[0], cv2.COLOR_RGB2BGR, dst=preview_buf)
+                cv2.imshow("Preview", preview_buf)
+                cv2.waitKey(1)
+
+            # 丟給背景存檔 (只傳slot編號)；拿不到slot代表saver落後SLOTS幀，記一次丟棄
+            if slot is not None:
+                commit(slot)
+            else:
+                dropped += 1
+            queue_sizes[i] = qsize()
+
+            loop_tick()
+            iteration += 1
+
+            # 每秒印一次狀態
+            now_ns = pc_ns()
+            if now_ns - last_print_ns >= 1_000_000_000:
+                # 每台get_fps只算一次，平均跟逐台顯示共用同一批值
+                fps_vals = np.fromiter((c.get_fps() for c in fps_counters.values()),
+                                       dtype=np.float32, count=len(fps_counters))
+                avg_fps = float(fps_vals.mean()) if fps_vals.size else 0.0
+                cam_cols = " ".join(f"cam{idx}={v:4.1f}"
+                                    for idx, v in zip(fps_counters, fps_vals))
+                print(f"  [{(now_ns - start_ns) / 1e9:5.1f}s] loop={loop_fps.get_fps():5.1f}fps | "
+                      f"cam_avg={avg_fps:5.1f}fps [{cam_cols}] | "
+                      f"queue={qsize()} | saved={saver.saved_count}")
+                last_print_ns = now_ns
+
+            loop_times[i] = pc_ns() - loop_start_ns
+
+            # 配速到絕對deadline: 每圈累加固定period，誤差不會一圈圈累積
+            pace_to(next_deadline_ns)
+            next_deadline_ns += target_period_ns
+    except KeyboardInterrupt:
+        print("\n測試被中斷")
+    finally:
+        camera_pool.shutdown()
+        saver.stop()
+        for cam in cameras.values():
+            cam.disconnect()
+        if preview:
+            cv2.destroyAllWindows()
+
+    # 最終統計 (只取實際寫入的前iteration筆)
+    loop_times = loop_times[:iteration]
+    camera_read_times = camera_read_times[:iteration]
+    queue_sizes = queue_sizes[:iteration]
+    print("=" * 80)
+    print(f"\n📊 統計 ({iteration} 次迭代):")
+    if loop_times.size:
+        _print_latency_stats("迴圈時間", loop_times)
+    if camera_read_times.size:
+        _print_latency_stats("相機讀取時間", camera_read_times)
+    if queue_sizes.size:
+        q50, q95, q99 = np.percentile(queue_sizes, [50, 95, 99])
+        print(f"\n存檔佇列深度:")
+        print(f"  平均: {np.mean(queue_sizes):.1f}")
+        print(f"  最大: {np.max(queue_sizes)}")
+        print(f"  p50/p95/p99: {q50:.0f} / {q95:.0f} / {q99:.0f}")
+    print(f"\n已存檔: {saver.saved_count} / {iteration} 幀 (slot寫滿丟棄: {dropped})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="錄製壓力測試")
+    parser.add_argument("camera_indices", nargs="+", type=int, help="相機編號")
+    parser.add_argument("--duration", type=int, default=60, help="測試時長（秒）")
+    parser.add_argument("--fps", type=int, default=30, help="目標錄製fps")
+    parser.add_argument("--preview", action="store_true", help="顯示第一個相機的預覽")
+    args = parser.parse_args()
+
+    stress_test_recording(args.camera_indices, args.duration, args.fps, args.preview)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+4機械臂錄製壓力測試 - 不需要真實硬體
+用模擬的馬達讀取延遲重現4隻手臂同時錄製時的系統負載，
+找出30fps錄製的瓶頸在哪裡（馬達匯流排、相機、還是存檔）
+"""
+import argparse
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from lerobot.cameras.opencv import OpenCVCamera, OpenCVCameraConfig
+
+
+class SimulatedRobot:
+    """模擬一隻手臂: 讀取關節位置時有匯流排延遲"""
+
+    def __init__(self, name, read_delay_ms=8.0):
+        self.name = name
+        self.read_delay_ms = read_delay_ms
+        self.position = np.zeros(6)
+        # observation的key固定不變，dict配置一次之後每幀只覆寫值
+        self._keys = tuple(f"{name}.joint_{i}.pos" for i in range(6))
+        self._obs = dict.fromkeys(self._keys, 0.0)
+        # 雜訊一次預抽一大塊: 每幀randn(6)的成本幾乎都在函式呼叫開銷，
+        # 批次抽樣把開銷攤平到4096幀
+        self._rng = np.random.default_rng()
+        self._noise = self._rng.standard_normal((4096, 6)) * 0.01
+        self._cursor = 0
+
+    def read_position(self):
+        # 模擬Dynamixel sync_read的匯流排延遲
+        time.sleep(self.read_delay_ms / 1000)
+        if self._cursor == len(self._noise):
+            self._rng.standard_normal((4096, 6), out=self._noise)
+            self._noise *= 0.01
+            self._cursor = 0
+        self.position += self._noise[self._cursor]
+        self._cursor += 1
+        return self.position  # 不複製: 呼叫端馬上取值出來
+
+    def get_observation(self):
+        pos = self.read_position()
+        obs = self._obs
+        for key, value in zip(self._keys, pos):
+            obs[key] = float(value)
+        return obs
+
+
+def _rolling_fps(ts_buf, head, count):
+    """ring buffer裡最舊到最新樣本之間的平均fps"""
+    if count < 2:
+        return 0.0
+    size = ts_buf.shape[0]
+    span_ns = ts_buf[(head - 1) % size] - ts_buf[(head - count) % size]
+    if span_ns <= 0:
+        return 0.0
+    return (count - 1) * 1e9 / span_ns
+
+
+try:
+    from numba import njit
+except ImportError:
+    pass  # 沒numba就用純Python版，邏輯相同
+else:
+    # eager signature: import時就編好，不會在主迴圈裡觸發JIT暖機
+    _rolling_fps = njit("float64(int64[:], int64, int64)", cache=True, fastmath=True)(_rolling_fps)
+
+
+class FPSCounter:
+    """滑動窗口FPS計數器 - 固定int64 ring buffer，tick只寫一個slot"""
+
+    def __init__(self, window_size=30):
+        self.ts_buf = np.empty(window_size, dtype=np.int64)
+        self.head = 0
+        self.count = 0
+
+    def tick(self):
+        self.ts_buf[self.head % len(self.ts_buf)] = time.perf_counter_ns()
+        self.head += 1
+        if self.count < len(self.ts_buf):
+            self.count += 1
+
+    def get_fps(self):
+        return _rolling_fps(self.ts_buf, self.head, self.count)
+
+
+class DataSaver:
+    """背景執行緒存檔器 - 模擬非同步episode寫入"""
+
+    def __init__(self, slot_pool=None):
+        # CPython保證deque的append/popleft原子性，省掉Queue每次put/get的mutex+condvar
+        self.dq = deque()
+        # 寫完的payload把frame_slot歸還到這個pool (deque append也是原子的)
+        self.slot_pool = slot_pool
+        self.has_data = threading.Event()
+        self.running = True
+        self.saved_count = 0
+        self.thread = threading.Thread(target=self._save_worker, daemon=True)
+        self.thread.start()
+
+    def save_frame(self, data):
+        self.dq.append(data)
+        self.has_data.set()
+
+    BATCH_SIZE = 32
+
+    def _save_worker(self):
+        batch = []
+        while self.running or self.dq:
+            if not self.dq:
+                self.has_data.wait(timeout=0.1)
+                self.has_data.clear()
+                continue
+            while self.dq and len(batch) < self.BATCH_SIZE:
+                batch.append(self.dq.popleft())
+            # 模擬批次寫入: 固定開銷約10ms + 每筆1ms，批次把固定開銷攤平
+            time.sleep(0.010 + 0.001 * len(batch))
+            self.saved_count += len(batch)
+            if self.slot_pool is not None:
+                # 寫完才歸還slot，producer拿不到slot就知道要丟幀
+                for item in batch:
+                    self.slot_pool.append(item['frame_slot'])
+            batch.clear()
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=5.0)
+
+
+def _print_latency_stats(title, arr_ns):
+    """ns陣列轉一次ms float，所有統計+percentile都算在同一個陣列上"""
+    ms = arr_ns / 1e6
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    print(f"\n{title} (ms):")
+    print(f"  平均: {ms.mean():.2f}")
+    print(f"  最小: {ms.min():.2f}")
+    print(f"  最大: {ms.max():.2f}")
+    print(f"  標準差: {ms.std():.2f}")
+    print(f"  p50/p95/p99: {p50:.2f} / {p95:.2f} / {p99:.2f}")
+
+
+def _set_timer_slack_ns(ns=50_000):
+    """用prctl降低kernel timer slack，讓短sleep醒得更準 (失敗就跳過，只影響配速精度)"""
+    try:
+        import ctypes
+        PR_SET_TIMERSLACK = 29
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_TIMERSLACK, ns, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
+
+def pace_to(deadline_ns):
+    """混合配速: 粗睡到deadline前~0.8ms，剩下用spin補足
+
+    純time.sleep在Linux有~1ms的喚醒誤差 (timer granularity + 排程jitter)，
+    粗睡+細spin把誤差壓到<100µs。
+    """
+    remaining_ns = deadline_ns - time.perf_counter_ns()
+    if remaining_ns > 800_000:
+        time.sleep((remaining_ns - 800_000) / 1e9)
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+
+def stress_test(camera_indices, duration_seconds=60, read_delay_ms=8.0, target_fps=30):
+    """模擬4隻手臂+N個相機的錄製主迴圈"""
+    print(f"🤖 4機械臂壓力測試: {duration_seconds}秒, 讀取延遲{read_delay_ms}ms, 目標{target_fps}fps")
+    print("=" * 80)
+
+    robots = {f"robot_{i}": SimulatedRobot(f"robot_{i}", read_delay_ms) for i in range(4)}
+
+    cameras = {}
+    for idx in camera_indices:
+        config = OpenCVCameraConfig(index_or_path=idx, fps=target_fps, width=640, height=480)
+        cam = OpenCVCamera(config)
+        cam.connect()
+        cameras[idx] = cam
+        print(f"📷 相機 {idx} 已連接")
+
+    fps_counters = {idx: FPSCounter() for idx in cameras}
+    loop_fps = FPSCounter()
+    # slot所有權靠free_slots流轉: producer取用、saver寫完歸還，
+    # 不會覆寫還在佇列上的slot
+    RING_SLOTS = 4
+    free_slots = deque(range(RING_SLOTS))
+    saver = DataSaver(slot_pool=free_slots)
+
+    # 統計buffer預先配好，迴圈內只做index寫入
+    # (list append每幀裝箱一個float還會週期性resize)
+    max_iters = int(duration_seconds * target_fps * 2) + 16
+    loop_times = np.empty(max_iters, dtype=np.int64)
+    robot_read_times = np.empty(max_iters, dtype=np.int64)
+    camera_read_times = np.empty(max_iters, dtype=np.int64)
+    queue_sizes = np.empty(max_iters, dtype=np.int32)
+
+    # 4隻手臂的讀取都在等sleep (真實硬體是等匯流排)，等待時會放掉GIL，
+    # 丟進常駐的thread pool讓等待重疊: 4×delay變成1×delay
+    robot_pool = ThreadPoolExecutor(max_workers=len(robots))
+    # 相機的async_read同理: N個等待用pool重疊，總時間從sum變成max
+    camera_pool = ThreadPoolExecutor(max_workers=len(cameras)) if cameras else None
+
+    # 暖機: 跟主迴圈一樣並行讀。async_read本來就會等到真實幀，不需要額外sleep
+    print("🔥 暖機中...")
+    if camera_pool is not None:
+        for _ in range(10):
+            for future in [camera_pool.submit(cam.async_read, timeout_ms=1000)
+                           for cam in cameras.values()]:
+                future.result()
+
+    # 迴圈內全用整數ns計時: perf_counter_ns比float版便宜，整數差值沒有捨入
+    duration_ns = int(duration_seconds * 1e9)
+    target_period_ns = int(1e9 / target_fps)
+    _set_timer_slack_ns()
+    start_ns = time.perf_counter_ns()
+    next_deadline_ns = start_ns + target_period_ns
+    last_print_ns = start_ns
+    iteration = 0
+
+    # 固定slot ring: 4組預先配好的(N_cam,H,W,3) stack，只寫saver已釋放的slot
+    frames_ring = (np.empty((RING_SLOTS, len(cameras), 480, 640, 3), np.uint8)
+                   if cameras else None)
+    # saver把所有slot都佔住時的scratch目標: 照樣讀相機 (fps統計不失真)，幀丟棄
+    drop_buf = np.empty((len(cameras), 480, 640, 3), np.uint8) if cameras else None
+    dropped = 0
+
+    # 固定schema: payload每個slot一份、只配置一次，saver才能安全讀回frame_slot
+    # (單一共用dict會在saver讀到前被下一圈改寫)
+    robot_obs = {}
+    frame_payloads = [{'timestamp': 0.0, 'robot_state': robot_obs, 'frame_slot': s,
+                       'frames_ring': frames_ring, 'cam_indices': tuple(cameras)}
+                      for s in range(RING_SLOTS)]
+
+    # 熱路徑的屬性查找先綁到local: LOAD_FAST比LOAD_ATTR/全域查找便宜，
+    # 30fps × 每圈十幾次呼叫省下的dict查找有感
+    pc_ns = time.perf_counter_ns
+    submit_robot = robot_pool.submit
+    robot_reads = [robot.get_observation for robot in robots.values()]
+    submit_cam = camera_pool.submit if camera_pool is not None else None
+    cam_reads = [(pos, idx, cam.async_read, fps_counters[idx].tick)
+                 for pos, (idx, cam) in enumerate(cameras.items())]
+    save_frame = saver.save_frame
+    dq = saver.dq
+    loop_tick = loop_fps.tick
+
+    try:
+        while iteration < max_iters and pc_ns() - start_ns < duration_ns:
+            i = iteration
+            loop_start_ns = pc_ns()
+
+            # 讀取4隻手臂 (並行)
+            t0 = pc_ns()
+            futures = [submit_robot(read) for read in robot_reads]
+            for future in futures:
+                robot_obs.update(future.result())
+            robot_read_times[i] = pc_ns() - t0
+
+            # 讀取相機 (並行)，結果直接copy進拿到的ring slot的對應列
+            t0 = pc_ns()
+            slot = free_slots.popleft() if free_slots else None
+            if submit_cam is not None:
+                dst = frames_ring[slot] if slot is not None else drop_buf
+                cam_futures = {submit_cam(read, timeout_ms=1000): (pos, tick)
+                               for pos, idx, read, tick in cam_reads}
+                for future in as_completed(cam_futures):
+                    pos, tick = cam_futures[future]
+                    np.copyto(dst[pos], future.result())
+                    tick()
+            camera_read_times[i] = pc_ns() - t0
+
+            # 丟給背景存檔；拿不到slot代表saver落後RING_SLOTS幀，記一次丟棄
+            if slot is not None:
+                frame_data = frame_payloads[slot]
+                frame_data['timestamp'] = (pc_ns() - start_ns) / 1e9
+                save_frame(frame_data)
+            else:
+                dropped += 1
+            queue_sizes[i] = len(dq)
+
+            loop_tick()
+            iteration += 1
+
+            # 每秒印一次狀態
+            now_ns = pc_ns()
+            if now_ns - last_print_ns >= 1_000_000_000:
+                # 每台get_fps只算一次，平均跟逐台顯示共用同一批值
+                fps_vals = np.fromiter((c.get_fps() for c in fps_counters.values()),
+                                       dtype=np.float32, count=len(fps_counters))
+                avg_fps = float(fps_vals.mean()) if fps_vals.size else 0.0
+                cam_cols = " ".join(f"cam{idx}={v:4.1f}"
+                                    for idx, v in zip(fps_counters, fps_vals))
+                print(f"  [{(now_ns - start_ns) / 1e9:5.1f}s] loop={loop_fps.get_fps():5.1f}fps | "
+                      f"cam_avg={avg_fps:5.1f}fps [{cam_cols}] | "
+                      f"queue={len(dq)} | saved={saver.saved_count}")
+                last_print_ns = now_ns
+
+            loop_times[i] = pc_ns() - loop_start_ns
+
+            # 配速到絕對deadline: 每圈累加固定period，誤差不會一圈圈累積
+            pace_to(next_deadline_ns)
+            next_deadline_ns += target_period_ns
+    except KeyboardInterrupt:
+        print("\n測試被中斷")
+    finally:
+        robot_pool.shutdown()
+        if camera_pool is not None:
+            camera_pool.shutdown()
+        saver.stop()
+        for cam in cameras.values():
+            cam.disconnect()
+
+    # 最終統計 (只取實際寫入的前iteration筆)
+    loop_times = loop_times[:iteration]
+    robot_read_times = robot_read_times[:iteration]
+    camera_read_times = camera_read_times[:iteration]
+    queue_sizes = queue_sizes[:iteration]
+    print("=" * 80)
+    print(f"\n📊 統計 ({iteration} 次迭代):")
+    if loop_times.size:
+        _print_latency_stats("迴圈時間", loop_times)
+    if robot_read_times.size:
+        _print_latency_stats("手臂讀取時間", robot_read_times)
+    if camera_read_times.size:
+        _print_latency_stats("相機讀取時間", camera_read_times)
+    if queue_sizes.size:
+        q50, q95, q99 = np.percentile(queue_sizes, [50, 95, 99])
+        print(f"\n存檔佇列深度:")
+        print(f"  平均: {np.mean(queue_sizes):.1f}")
+        print(f"  最大: {np.max(queue_sizes)}")
+        print(f"  p50/p95/p99: {q50:.0f} / {q95:.0f} / {q99:.0f}")
+    print(f"\n已存檔: {saver.saved_count} / {iteration} 幀 (slot寫滿丟棄: {dropped})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="4機械臂錄製壓力測試")
+    parser.add_argument("camera_indices", nargs="*", type=int, default=[],
+                        help="相機編號 (可留空，只測手臂)")
+    parser.add_argument("--duration", type=int, default=60, help="測試時長（秒）")
+    parser.add_argument("--read-delay-ms", type=float, default=8.0, help="模擬的馬達讀取延遲（毫秒）")
+    parser.add_argument("--fps", type=int, default=30, help="目標錄製fps")
+    args = parser.parse_args()
+
+    stress_test(args.camera_indices, args.duration, args.read_delay_ms, args.fps)